@@ -1,39 +1,234 @@
 import streamlit as st
 import pandas as pd
 import sqlite3
-from datetime import datetime, time
+from datetime import datetime, time, timezone
 import plotly.express as px
 from fpdf import FPDF
+from fpdf.enums import XPos, YPos
 import io
 import os
-import re 
-import base64 
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
+import re
+import json
+try:
+    # SIMD-accelerated codec with the same API as the stdlib module
+    import pybase64 as base64
+except ImportError:
+    import base64
 
 # --- CONFIGURATION & SETUP ---
 st.set_page_config(page_title="TheraTrack Pro", layout="wide", page_icon="🧠")
 
 # Database Connection
-def get_connection():
-    # Connect to the local SQLite database file
-    conn = sqlite3.connect('therapy_data.db', check_same_thread=False)
+DB_PATH = 'therapy_data.db'
+
+# Every query is parameterized, so its SQL text is stable and the per-connection
+# statement cache can hand back the compiled statement; sized above the app's query count
+STATEMENT_CACHE_SIZE = 256
+
+def _connect(database, uri=False):
+    conn = sqlite3.connect(database, uri=uri, check_same_thread=False, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache per connection
+    conn.execute("PRAGMA foreign_keys=ON")
+    # SQLite's upper() only folds ASCII; this matches pandas' case-insensitive str.contains
+    conn.create_function("unicode_upper", 1, lambda s: s.upper() if isinstance(s, str) else s, deterministic=True)
     return conn
 
+class SqlitePool:
+    # One read-write connection guarded by a lock, plus N read-only connections
+    # so concurrent sessions can read while a write is in flight (WAL mode).
+    def __init__(self, path, readers=4):
+        self._writer = _connect(path)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        # Truncate the -wal file back to ~6 MB after checkpoints instead of leaving it at its peak size
+        self._writer.execute("PRAGMA journal_size_limit=6144000")
+        self._write_lock = threading.Lock()
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(_connect(f"file:{path}?mode=ro", uri=True))
+
+    @contextmanager
+    def read(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @contextmanager
+    def write(self):
+        # Each write block runs as a single transaction
+        with self._write_lock:
+            self._writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._writer
+                self._writer.execute("COMMIT")
+            except BaseException:
+                # Also covers a failed COMMIT (busy, disk full), which leaves the transaction open;
+                # without the rollback every later BEGIN on the shared writer would fail
+                if self._writer.in_transaction:
+                    self._writer.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+        with self._write_lock:
+            self._writer.close()
+
+@st.cache_resource
+def get_pool():
+    # One pool per process, shared across reruns and sessions; closed cleanly on exit
+    pool = SqlitePool(DB_PATH, readers=4)
+    atexit.register(pool.close)
+    return pool
+
+def query_df(sql, params=None, parse_dates=None):
+    with get_pool().read() as conn:
+        return pd.read_sql(sql, conn, params=params, parse_dates=parse_dates)
+
+def fetch_col(sql, params=()):
+    # First column as a plain list, for dropdown options and other list-only reads
+    with get_pool().read() as conn:
+        return [row[0] for row in conn.execute(sql, params)]
+
+def query_scalar(sql, params=()):
+    # Single-value reads (counts) skip the DataFrame construction entirely
+    with get_pool().read() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+def now_ts():
+    # Second precision in the 'YYYY-MM-DD HH:MM:SS' layout existing rows use, so TEXT ordering stays chronological
+    return datetime.now().isoformat(sep=' ', timespec='seconds')
+
+STATUS_CHOICES = ("Active", "Terminated", "No-Show", "Inactive")
+STATUS_INDEX = {status: i for i, status in enumerate(STATUS_CHOICES)}
+
+RISK_KEYWORDS = ("Suicidal Ideation", "Homicidal Ideation", "Self-Harm Risk", "Grave Disability")
+# Single-pass matcher for the same flags; case-sensitive like the instr() check in fetch_risk_df
+_RISK_RE = re.compile("|".join(map(re.escape, RISK_KEYWORDS)))
+
+# Cached Reads (clear the matching cache after writing to the tables behind it)
+@st.cache_data(ttl=60)
+def fetch_risk_df(user):
+    # Clients whose latest SOAP note carries a risk flag; dedup and keyword match run in SQLite.
+    # instr() is case-sensitive like Python's `in` (LIKE would also flag e.g. "denies suicidal ideation")
+    risk_match = " OR ".join("instr(assessment, ?) > 0" for _ in RISK_KEYWORDS)
+    return query_df(f"""
+        SELECT id, name, status, assessment, date FROM (
+            SELECT c.id, c.name, c.status, s.assessment, s.date,
+                   ROW_NUMBER() OVER (PARTITION BY c.id ORDER BY s.date DESC) AS rn
+            FROM soap_notes s 
+            JOIN clients c ON s.client_id = c.id 
+            WHERE c.therapist_id=?
+        )
+        WHERE rn = 1 AND ({risk_match})
+        ORDER BY date DESC
+    """, params=[user, *RISK_KEYWORDS])
+
+@st.cache_data(ttl=60)
+def fetch_client_count(user):
+    return query_scalar("SELECT count(*) FROM clients WHERE therapist_id=?", (user,))
+
+@st.cache_data(ttl=60)
+def fetch_session_count(user):
+    return query_scalar("SELECT count(*) FROM sessions WHERE therapist_id=?", (user,))
+
+@st.cache_data(ttl=60)
+def fetch_recent_sessions(user):
+    return query_df("""
+        SELECT c.name, s.date, s.session_number, s.session_time, s.rating 
+        FROM sessions s JOIN clients c ON s.client_id = c.id 
+        WHERE s.therapist_id=? 
+        ORDER BY s.date_ts DESC LIMIT 5""", params=[user])
+
+@st.cache_data(ttl=60)
+def fetch_goal_counts(user, client_name=None, goal_keyword=""):
+    # Splits the comma-joined goals_selected with a recursive CTE and counts in SQLite,
+    # so only one row per distinct goal comes back. The keyword test is a literal,
+    # case-insensitive instr(), the same match the Session Data table's str.contains makes
+    return query_df("""
+        WITH RECURSIVE split(goal, rest) AS (
+            SELECT '', s.goals_selected || ','
+            FROM sessions s JOIN clients c ON s.client_id = c.id
+            WHERE s.therapist_id=? AND (? IS NULL OR c.name=?)
+              AND instr(unicode_upper(s.goals_selected), unicode_upper(?)) > 0
+            UNION ALL
+            SELECT trim(substr(rest, 1, instr(rest, ',') - 1)), substr(rest, instr(rest, ',') + 1)
+            FROM split WHERE rest <> ''
+        )
+        SELECT goal AS "Goal", count(*) AS "Sessions Addressed"
+        FROM split WHERE goal <> ''
+        GROUP BY goal ORDER BY count(*) DESC, goal""",
+        params=[user, client_name, client_name, goal_keyword]).astype({"Sessions Addressed": "int32"})
+
+@st.cache_data(ttl=60)
+def load_clients(user):
+    # Profile and site for every client in one round-trip
+    return query_df("""
+        SELECT c.*, s.name AS site_name, s.type AS site_type
+        FROM clients c
+        LEFT JOIN sites s ON s.id = c.site_id
+        WHERE c.therapist_id=?""", params=[user])
+
+@st.cache_data(ttl=300)
+def load_sessions(user):
+    # Analytics filters run on this cached frame, so widget changes don't re-query
+    return query_df("""
+        SELECT c.name, s.date, s.session_number, s.session_time, s.rating, s.goals_selected, s.progress_notes 
+        FROM sessions s 
+        JOIN clients c ON s.client_id = c.id 
+        WHERE s.therapist_id=?
+        ORDER BY s.date_ts""", params=[user], parse_dates={'date': {'format': 'ISO8601'}})
+
+# Goal templates rarely change; client goals change only through the Client Goals tab
+@st.cache_data(ttl=300)
+def load_all_goals():
+    return query_df("SELECT * FROM goals")
+
+@st.cache_data(ttl=60)
+def load_client_goals(client_id):
+    return fetch_col("SELECT goal_description FROM client_goals WHERE client_id=?", (client_id,))
+
+@st.cache_data(ttl=300)
+def load_sites(user):
+    return query_df("SELECT * FROM sites WHERE therapist_id=?", params=[user])
+
 # File Handling Helpers
-def get_base64_data(uploaded_file):
-    # Reads file and returns Base64 string for storage
-    bytes_data = uploaded_file.read()
-    return base64.b64encode(bytes_data).decode('utf-8')
-
-def display_file(filename, filedata_b64, filetype):
-    # Decodes Base64 data for display/download
-    data_url = f"data:{filetype};base64,{filedata_b64}"
+BLOB_CHUNK_SIZE = 64 * 1024
+
+def save_file_blob(conn, client_id, uploaded_file):
+    # Reserve the BLOB with zeroblob() and stream the upload into it in fixed-size chunks
+    cur = conn.execute("INSERT INTO client_files (client_id, filename, filetype, filedata, upload_date) VALUES (?, ?, ?, zeroblob(?), ?)",
+                       (client_id, uploaded_file.name, uploaded_file.type, uploaded_file.size, now_ts()))
+    uploaded_file.seek(0)
+    with conn.blobopen("client_files", "filedata", cur.lastrowid) as blob:
+        while chunk := uploaded_file.read(BLOB_CHUNK_SIZE):
+            blob.write(chunk)
+
+@st.cache_data(max_entries=8)
+def get_file_blob(file_id):
+    # client_files ids are AUTOINCREMENT and never reused, so the cache needs no invalidation
+    return query_scalar("SELECT filedata FROM client_files WHERE id=?", (file_id,))
+
+def display_file(filename, filedata, filetype):
+    # Files saved before BLOB storage come back as a Base64 TEXT value
+    if isinstance(filedata, str):
+        filedata = base64.b64decode(filedata)
     if 'image' in filetype:
-        st.image(data_url, caption=filename, width=200)
+        st.image(io.BytesIO(filedata), caption=filename, width=200)
     elif 'pdf' in filetype:
         st.markdown(f"**{filename}**")
         st.download_button(
             label="Download PDF",
-            data=base64.b64decode(filedata_b64),
+            data=filedata,
             file_name=filename,
             mime=filetype
         )
@@ -41,121 +236,179 @@ def display_file(filename, filedata_b64, filetype):
         st.markdown(f"File: **{filename}** ({filetype})")
         st.download_button(
             label="Download File",
-            data=base64.b64decode(filedata_b64),
+            data=filedata,
             file_name=filename,
             mime=filetype
         )
 
 
 # Initialize Database Tables
+def _add_client_cascade(c, table):
+    # SQLite can't add a constraint in place, so rebuild the table from its own DDL
+    sql = c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()[0]
+    if 'REFERENCES clients' in sql:
+        return
+    sql = sql.replace('client_id INTEGER', 'client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE', 1)
+    c.execute(re.sub(rf'^CREATE TABLE {table}\b', f'CREATE TABLE {table}_new', sql))
+    # Rows already orphaned by an earlier delete would violate the new constraint; keep them, detached
+    c.execute(f"UPDATE {table} SET client_id = NULL WHERE client_id NOT IN (SELECT id FROM clients)")
+    # DROP TABLE discards the AUTOINCREMENT high-water mark; carry it over so ids are never reused
+    seq = c.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+    c.execute(f"INSERT INTO {table}_new SELECT * FROM {table}")
+    c.execute(f"DROP TABLE {table}")
+    c.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    if seq:
+        c.execute("DELETE FROM sqlite_sequence WHERE name=?", (table,))
+        c.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seq[0]))
+
+def _add_column(c, table, column, decl):
+    # Check first rather than letting ALTER fail, so no statement errors inside init_db's transaction
+    if column not in {row[1] for row in c.execute(f"PRAGMA table_info({table})")}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+# Bump whenever the schema below changes so existing databases re-run init_db()
+SCHEMA_VERSION = 5
+
+@st.cache_resource
 def init_db():
-    conn = get_connection()
-    c = conn.cursor()
+    # Runs once per process; skipped entirely when the database is already current
+    pool = get_pool()
+    with pool.read() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+    # The whole setup is one BEGIN IMMEDIATE ... COMMIT, so first launch and migrations sync once
+    with pool.write() as conn:
+        c = conn.cursor()
     
-    # Core Tables
-    c.execute('''CREATE TABLE IF NOT EXISTS users 
-                 (username TEXT PRIMARY KEY, password TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS goals 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT, description TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS soap_notes 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, date DATE, 
-                  subjective TEXT, objective TEXT, assessment TEXT, plan TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS client_goals
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, 
-                  goal_description TEXT, UNIQUE(client_id, goal_description))''')
-    c.execute('''CREATE TABLE IF NOT EXISTS diagnostic_history 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, date DATE, 
-                  diagnosis_code TEXT, diagnosis_description TEXT, notes TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS client_files
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, filename TEXT, 
-                  filetype TEXT, filedata BLOB, upload_date DATE)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS therapist_checkin 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, date DATE,
-                  therapist_id TEXT, energy_rating INTEGER, focus_rating INTEGER, notes TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS session_resources 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER, title TEXT,
-                  url TEXT, notes TEXT, therapist_id TEXT)''')
+        # Core Tables
+        c.execute('''CREATE TABLE IF NOT EXISTS users 
+                     (username TEXT PRIMARY KEY, password TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS goals 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, category TEXT, description TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS soap_notes 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE, date DATE, 
+                      subjective TEXT, objective TEXT, assessment TEXT, plan TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS client_goals
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE, 
+                      goal_description TEXT, UNIQUE(client_id, goal_description))''')
+        c.execute('''CREATE TABLE IF NOT EXISTS diagnostic_history 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE, date DATE, 
+                      diagnosis_code TEXT, diagnosis_description TEXT, notes TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS client_files
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE, filename TEXT, 
+                      filetype TEXT, filedata BLOB, upload_date DATE)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS therapist_checkin 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE, date DATE,
+                      therapist_id TEXT, energy_rating INTEGER, focus_rating INTEGER, notes TEXT)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS session_resources 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE, title TEXT,
+                      url TEXT, notes TEXT, therapist_id TEXT)''')
                   
-    # Sites Table
-    c.execute('''CREATE TABLE IF NOT EXISTS sites 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  name TEXT, address TEXT, type TEXT, therapist_id TEXT)''')
+        # Sites Table
+        c.execute('''CREATE TABLE IF NOT EXISTS sites 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
+                      name TEXT, address TEXT, type TEXT, therapist_id TEXT)''')
     
-    # Session Plans (Structured Data)
-    c.execute('''CREATE TABLE IF NOT EXISTS session_plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                client_id INTEGER,
-                date DATE,
-                plan_intro TEXT,
-                plan_checkin TEXT,
-                plan_warmup TEXT,
-                plan_main TEXT,
-                plan_reflection TEXT,
-                plan_props TEXT,
-                plan_closing TEXT,
-                plan_notes TEXT,
-                therapist_id TEXT
-            )''')
-
-
-    # Clients table must be created/updated with 'site_id'
-    c.execute('''CREATE TABLE IF NOT EXISTS clients 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  name TEXT, dob DATE, diagnosis TEXT, history TEXT, 
-                  therapist_id TEXT)''')
-    try:
-        c.execute("ALTER TABLE clients ADD COLUMN status TEXT DEFAULT 'Active'")
-    except sqlite3.OperationalError:
-        pass
-    try:
-        c.execute("ALTER TABLE clients ADD COLUMN site_id INTEGER")
-    except sqlite3.OperationalError:
-        pass
-
-
-    # Sessions table must be created/updated with 'session_time'
-    c.execute('''CREATE TABLE IF NOT EXISTS sessions 
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  client_id INTEGER, date DATE, session_number INTEGER, 
-                  goals_selected TEXT, progress_notes TEXT, 
-                  rating INTEGER, therapist_id TEXT)''')
-    try:
-        c.execute("ALTER TABLE sessions ADD COLUMN session_time TEXT")
-    except sqlite3.OperationalError:
-        pass 
-    
-    # Seed Default Goals (Goal Templates)
-    c.execute("SELECT count(*) FROM goals")
-    if c.fetchone()[0] == 0:
-        default_goals = [
-            ("Emotional & Psychological Well-being", "Enhance emotional expression and regulation"),
-            ("Emotional & Psychological Well-being", "Increase self-awareness and self-esteem"),
-            ("Emotional & Psychological Well-being", "Process and integrate psychological trauma"),
-            ("Emotional & Psychological Well-being", "Reduce symptoms of anxiety, depression, and stress"),
-            ("Emotional & Psychological Well-being", "Improve mood and overall quality of life"),
-            ("Emotional & Psychological Well-being", "Develop positive coping mechanisms"),
-            ("Physical Health & Function", "Increase body awareness and mind-body connection"),
-            ("Physical Health & Function", "Improve coordination, balance, strength, and flexibility"),
-            ("Physical Health & Function", "Reduce muscle tension and chronic pain"),
-            ("Physical Health & Function", "Enhance motor skills and range of motion"),
-            ("Social & Interpersonal Functioning", "Develop effective verbal and nonverbal communication skills"),
-            ("Social & Interpersonal Functioning", "Build trust and empathy in relationships"),
-            ("Social & Interpersonal Functioning", "Enhance interpersonal relationships and social interaction"),
-            ("Social & Interpersonal Functioning", "Overcome social isolation and foster a sense of belonging"),
-            ("Cognitive Function & Insight", "Improve executive function, attention, and memory"),
-            ("Cognitive Function & Insight", "Gain insight into personal behaviors and patterns"),
-            ("Cognitive Function & Insight", "Enhance problem-solving abilities"),
-            ("Cognitive Function & Insight", "Stimulate neuroplasticity and brain function")
+        # Session Plans (Structured Data)
+        c.execute('''CREATE TABLE IF NOT EXISTS session_plans (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE,
+                    date DATE,
+                    plan_intro TEXT,
+                    plan_checkin TEXT,
+                    plan_warmup TEXT,
+                    plan_main TEXT,
+                    plan_reflection TEXT,
+                    plan_props TEXT,
+                    plan_closing TEXT,
+                    plan_notes TEXT,
+                    therapist_id TEXT
+                )''')
+
+
+        # Clients table must be created/updated with 'site_id'
+        c.execute('''CREATE TABLE IF NOT EXISTS clients 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
+                      name TEXT, dob DATE, diagnosis TEXT, history TEXT, 
+                      therapist_id TEXT)''')
+        _add_column(c, "clients", "status", "TEXT DEFAULT 'Active'")
+        _add_column(c, "clients", "site_id", "INTEGER")
+
+
+        # Sessions table must be created/updated with 'session_time'
+        c.execute('''CREATE TABLE IF NOT EXISTS sessions 
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, 
+                      client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE, date DATE, session_number INTEGER, 
+                      goals_selected TEXT, progress_notes TEXT, 
+                      rating INTEGER, therapist_id TEXT)''')
+        _add_column(c, "sessions", "session_time", "TEXT")
+        # Integer sort key (UTC epoch of date + session_time) so ordering compares ints, not TEXT
+        _add_column(c, "sessions", "date_ts", "INTEGER")
+        c.execute("""UPDATE sessions SET date_ts = CAST(strftime('%s', date || ' ' || COALESCE(session_time, '00:00')) AS INTEGER)
+                     WHERE date_ts IS NULL""")
+
+        # Child rows cascade when their client is deleted
+        for table in ("sessions", "soap_notes", "client_goals", "diagnostic_history", "client_files",
+                      "therapist_checkin", "session_resources", "session_plans"):
+            _add_client_cascade(c, table)
+
+        # Indexes for the therapist/client lookups on the Dashboard, My Sites and Client Records tabs
+        indexes = [
+            ("idx_sessions_therapist_date_ts", "sessions(therapist_id, date_ts DESC)"),
+            # Lets the ON DELETE CASCADE from clients find a client's sessions without a table scan
+            ("idx_sessions_client_date_ts", "sessions(client_id, date_ts DESC)"),
+            # Covers the Dashboard's latest-note-per-client risk scan without touching the table
+            ("idx_soap_notes_client_date_assessment", "soap_notes(client_id, date DESC, assessment)"),
+            ("idx_clients_therapist_status", "clients(therapist_id, status)"),
+            ("idx_client_files_client_date", "client_files(client_id, upload_date DESC)"),
+            ("idx_diagnostic_history_client_date", "diagnostic_history(client_id, date DESC)"),
+            ("idx_therapist_checkin_client_date", "therapist_checkin(client_id, date DESC)"),
+            ("idx_session_plans_client_date", "session_plans(client_id, date DESC)"),
+            ("idx_session_resources_client", "session_resources(client_id)"),
+            ("idx_sites_therapist", "sites(therapist_id)"),
         ]
-        c.executemany("INSERT INTO goals (category, description) VALUES (?, ?)", default_goals)
+        # Superseded by the wider indexes above
+        for name in ("idx_sessions_therapist_date", "idx_client_files_client", "idx_soap_notes_client_date"):
+            c.execute(f"DROP INDEX IF EXISTS {name}")
+        existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        for name, target in indexes:
+            c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        if any(name not in existing for name, _ in indexes):
+            # Refresh planner statistics only when a new index was added
+            c.execute("ANALYZE")
+
+        # Seed Default Goals (Goal Templates)
+        c.execute("SELECT count(*) FROM goals")
+        if c.fetchone()[0] == 0:
+            default_goals = [
+                ("Emotional & Psychological Well-being", "Enhance emotional expression and regulation"),
+                ("Emotional & Psychological Well-being", "Increase self-awareness and self-esteem"),
+                ("Emotional & Psychological Well-being", "Process and integrate psychological trauma"),
+                ("Emotional & Psychological Well-being", "Reduce symptoms of anxiety, depression, and stress"),
+                ("Emotional & Psychological Well-being", "Improve mood and overall quality of life"),
+                ("Emotional & Psychological Well-being", "Develop positive coping mechanisms"),
+                ("Physical Health & Function", "Increase body awareness and mind-body connection"),
+                ("Physical Health & Function", "Improve coordination, balance, strength, and flexibility"),
+                ("Physical Health & Function", "Reduce muscle tension and chronic pain"),
+                ("Physical Health & Function", "Enhance motor skills and range of motion"),
+                ("Social & Interpersonal Functioning", "Develop effective verbal and nonverbal communication skills"),
+                ("Social & Interpersonal Functioning", "Build trust and empathy in relationships"),
+                ("Social & Interpersonal Functioning", "Enhance interpersonal relationships and social interaction"),
+                ("Social & Interpersonal Functioning", "Overcome social isolation and foster a sense of belonging"),
+                ("Cognitive Function & Insight", "Improve executive function, attention, and memory"),
+                ("Cognitive Function & Insight", "Gain insight into personal behaviors and patterns"),
+                ("Cognitive Function & Insight", "Enhance problem-solving abilities"),
+                ("Cognitive Function & Insight", "Stimulate neuroplasticity and brain function")
+            ]
+            c.executemany("INSERT INTO goals (category, description) VALUES (?, ?)", default_goals)
         
-    # Seed Default Admin User (only if no users exist at all)
-    c.execute("SELECT count(*) FROM users")
-    if c.fetchone()[0] == 0:
-        c.execute("INSERT INTO users VALUES ('admin', 'admin')")
+        # Seed Default Admin User (only if no users exist at all)
+        c.execute("SELECT count(*) FROM users")
+        if c.fetchone()[0] == 0:
+            c.execute("INSERT INTO users VALUES ('admin', 'admin')")
 
-    conn.commit()
-    conn.close()
+        c.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
 
 init_db()
 
@@ -177,8 +430,7 @@ if 'signup_mode' not in st.session_state:
     st.session_state.signup_mode = False
 
 def login_page():
-    conn = get_connection()
-    c = conn.cursor()
+    pool = get_pool()
     
     # --- Image Area (Replaced with text header to fix compile error) ---
     st.markdown("<h1 style='text-align: center; color: #1e88e5;'>🧠 TheraTrack: Therapist's Documentation Manager</h1>", unsafe_allow_html=True)
@@ -198,8 +450,8 @@ def login_page():
             c1, c2 = st.columns(2)
             with c1:
                 if st.button("Login", type="primary"):
-                    c.execute("SELECT * FROM users WHERE username=? AND password=?", (username, password))
-                    user = c.fetchone()
+                    with pool.read() as conn:
+                        user = conn.execute("SELECT * FROM users WHERE username=? AND password=?", (username, password)).fetchone()
                     if user:
                         st.session_state.logged_in = True
                         st.session_state.user = username
@@ -225,8 +477,8 @@ def login_page():
                         st.error("Username and Password cannot be empty.")
                     else:
                         try:
-                            c.execute("INSERT INTO users VALUES (?, ?)", (new_user, new_pass))
-                            conn.commit()
+                            with pool.write() as conn:
+                                conn.execute("INSERT INTO users VALUES (?, ?)", (new_user, new_pass))
                             st.success(f"Account '{new_user}' created! Please log in.")
                             st.session_state.signup_mode = False
                             st.rerun()
@@ -245,36 +497,377 @@ def login_page():
             # Using a known common WindowsApps path structure for the batch file
             specific_path = r"C:\Users\dwtdm\AppData\Local\Microsoft\WindowsApps\PythonSoftwareFoundation.Python.3.13_qbz5n2kfra8p0\python.exe -m streamlit"
             create_batch_file(specific_path)
-            
-    conn.close()
 
 
 # --- PDF GENERATOR ---
 def create_pdf(client_name, df_sessions, df_soap):
     pdf = FPDF()
     pdf.add_page()
-    pdf.set_font("Arial", size=12)
+    pdf.set_font("Helvetica", size=12)
     
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(200, 10, txt=f"Client Report: {client_name}", ln=True, align='C')
+    pdf.set_font("Helvetica", 'B', 16)
+    pdf.cell(200, 10, text=f"Client Report: {client_name}", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
     pdf.ln(10)
     
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(200, 10, txt="Session Summary", ln=True, align='L')
+    pdf.set_font("Helvetica", 'B', 12)
+    pdf.cell(200, 10, text="Session Summary", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='L')
     
-    pdf.set_font("Arial", size=10)
-    for index, row in df_sessions.iterrows():
-        line = f"Date: {row['date']} | Time: {row['session_time']} | Session: {row['session_number']} | Rating: {row['rating']}/10"
-        pdf.cell(200, 10, txt=line, ln=True)
-        pdf.multi_cell(0, 5, txt=f"Goals: {row['goals_selected']}")
-        pdf.multi_cell(0, 5, txt=f"Notes: {row['progress_notes']}")
+    pdf.set_font("Helvetica", size=10)
+    # Session dates arrive parsed; print them as plain dates
+    dates = df_sessions['date'].dt.strftime('%Y-%m-%d').fillna('')
+    rows = df_sessions.assign(date=dates)[['date', 'session_time', 'session_number', 'rating', 'goals_selected', 'progress_notes']]
+    for date, session_time, session_number, rating, goals, notes in rows.itertuples(index=False, name=None):
+        line = f"Date: {date} | Time: {session_time} | Session: {session_number} | Rating: {rating}/10"
+        pdf.cell(200, 10, text=line, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        # Goals and notes share one multi_cell; the explicit newline keeps them on separate lines
+        pdf.multi_cell(0, 5, text=f"Goals: {goals}\nNotes: {notes}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
         pdf.ln(2)
         
-    return pdf.output(dest='S').encode('latin-1')
+    # fpdf2 renders straight to bytes; no str round-trip through latin-1
+    return bytes(pdf.output())
+
+@st.cache_data(max_entries=8)
+def build_pdf_report(client_name, df_sessions, df_soap):
+    # Keyed on the frames' contents, so an edited session or note produces a fresh report
+    return create_pdf(client_name, df_sessions, df_soap)
+
+@st.cache_data(max_entries=8)
+def build_csv_export(df):
+    # Same content keying as the PDF: filter changes that leave the rows alone reuse the bytes
+    return df.to_csv(index=False).encode('utf-8')
+
+# --- DASHBOARD CALLBACKS ---
+def update_risk_status(client_id, client_name, key):
+    # Runs before the rerun the form submit triggers, so no explicit st.rerun() is needed
+    new_status = st.session_state[key]
+    with get_pool().write() as conn:
+        conn.execute("UPDATE clients SET status=? WHERE id=?", (new_status, client_id))
+    fetch_risk_df.clear()
+    load_clients.clear()
+    st.toast(f"Status for {client_name} updated to {new_status}.")
+
+# --- CLIENT RECORD TABS ---
+def delete_selected_rows(sql, params, editor_key, message, on_deleted=None):
+    # Button callback: one DELETE for every ticked row. The editor's ticks are keyed by row
+    # position, so drop them too or they would land on whichever rows move up
+    with get_pool().write() as conn:
+        conn.execute(sql, params)
+    st.session_state.pop(editor_key, None)
+    if on_deleted:
+        on_deleted()
+    st.toast(message)
+
+# Each tab reruns on its own when its widgets change instead of rerunning every tab
+@st.fragment
+def soap_notes_tab(client_id):
+    pool = get_pool()
+    st.subheader("📝 Add SOAP Note")
+    # Subjective
+    st.markdown("#### Subjective (Client Reports)")
+    col_s1, col_s2 = st.columns(2)
+    with col_s1:
+        reported_mood = st.selectbox("Reported Mood", 
+            ["Euthymic/Neutral", "Depressed/Sad", "Anxious/Worried", "Angry/Irritable", "Euphoric/Manic", "Fluctuating"], key="soap_mood")
+        symptoms = st.multiselect("Presenting Symptoms", 
+            ["Sleep Disturbance", "Appetite Changes", "Low Energy", "Panic Attacks", "Flashbacks", "Social Withdrawal", "Excessive Guilt", "Substance Use"], key="soap_symptoms")
+    with col_s2:
+        s_narrative = st.text_area("Subjective Narrative (Quotes/Context)", height=100, key="soap_snarrative")
+    final_subj = f"Mood: {reported_mood} | Symptoms: {', '.join(symptoms)}\nNotes: {s_narrative}"
+
+    st.divider()
+
+    # Objective
+    st.markdown("#### Objective (Therapist Observations)")
+    col_o1, col_o2 = st.columns(2)
+    with col_o1:
+        affect = st.selectbox("Affect", ["Appropriate/Congruent", "Flat/Blunted", "Labile", "Constricted", "Inappropriate"], key="soap_affect")
+        orientation = st.multiselect("Orientation", ["Person", "Place", "Time", "Situation"], default=["Person", "Place", "Time", "Situation"], key="soap_orientation")
+        appearance = st.multiselect("Appearance/Behavior", ["Well-Groomed", "Disheveled", "Psychomotor Agitation", "Psychomotor Retardation", "Poor Eye Contact", "Cooperative"], key="soap_appearance")
+    with col_o2:
+        o_narrative = st.text_area("Objective Observations (Details)", height=150, key="soap_onarrative")
+    final_obj = f"Affect: {affect} | Orientation: {', '.join(orientation)} | Appearance: {', '.join(appearance)}\nNotes: {o_narrative}"
+
+    st.divider()
+
+    # Assessment & Plan
+    col_ap1, col_ap2 = st.columns(2)
+    with col_ap1:
+        st.markdown("#### Assessment")
+        risk_status = st.multiselect("Risk Assessment", ["No Current Risk", *RISK_KEYWORDS], key="soap_risk")
+        s_assess = st.text_area("Clinical Impression/Analysis", height=100, key="soap_assess")
+        final_assess = f"Risk: {', '.join(risk_status)} | Analysis: {s_assess}"
+    
+    with col_ap2:
+        st.markdown("#### Plan")
+        next_sess = st.date_input("Next Session Date", key="soap_nextdate")
+        s_plan = st.text_area("Interventions & Homework", height=100, key="soap_plan")
+        final_plan = f"Next Session: {next_sess}\nPlan: {s_plan}"
+
+    if st.button("Save SOAP Note", type="primary", key="save_soap"):
+        with pool.write() as conn:
+            conn.execute("INSERT INTO soap_notes (client_id, date, subjective, objective, assessment, plan) VALUES (?, ?, ?, ?, ?, ?)",
+                         (client_id, now_ts(), final_subj, final_obj, final_assess, final_plan))
+        # No rerun needed: the history below is read after this insert, and the Dashboard
+        # picks up the new note from the cleared risk cache the next time it is shown
+        fetch_risk_df.clear()
+        st.success("SOAP Note Saved Successfully!")
+    
+    st.divider()
+    st.subheader("📜 Past SOAP Notes")
+    # Page through history so render cost stays flat as notes accumulate
+    note_count = query_scalar("SELECT count(*) FROM soap_notes WHERE client_id=?", (client_id,))
+    page_size = 10
+    page = 1
+    if note_count > page_size:
+        page_count = -(-note_count // page_size)
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key=f"soap_page_{client_id}")
+    soap_hist = query_df("SELECT date, subjective, objective, assessment, plan FROM soap_notes WHERE client_id=? ORDER BY date DESC LIMIT ? OFFSET ?",
+                         params=[client_id, page_size, (page - 1) * page_size], parse_dates={'date': {'format': 'ISO8601'}})
+    
+    for note in soap_hist.itertuples(index=False):
+        with st.expander(f"Note from {note.date:%Y-%m-%d %H:%M}"):
+            st.markdown(f"**S:** {note.subjective}")
+            st.markdown(f"**O:** {note.objective}")
+            st.markdown(f"**A:** {note.assessment}")
+            st.markdown(f"**P:** {note.plan}")
+
+
+@st.fragment
+def session_plans_tab(client_id):
+    pool = get_pool()
+    st.subheader("🗓️ Create or Update Session Plan")
+    
+    plan_date = st.date_input("Plan Date", key="plan_date")
+    
+    st.markdown("---")
+    
+    col_plan_1, col_plan_2, col_plan_3 = st.columns(3)
+    
+    with col_plan_1:
+        plan_intro = st.text_area("1. Introduction/Arrival", height=100, key="plan_intro")
+        plan_checkin = st.text_area("2. Check In", height=100, key="plan_checkin")
+    
+    with col_plan_2:
+        plan_warmup = st.text_area("3. Warm Up", height=100, key="plan_warmup")
+        plan_main = st.text_area("4. Main Theme/Activity", height=100, key="plan_main")
+    
+    with col_plan_3:
+        plan_reflection = st.text_area("5. Reflection", height=100, key="plan_reflection")
+        plan_closing = st.text_area("6. Closing", height=100, key="plan_closing")
+
+    st.markdown("---")
+    
+    col_props, col_notes = st.columns(2)
+    with col_props:
+        plan_props = st.text_area("Props Used (Materials needed)", height=100, key="plan_props")
+    with col_notes:
+        plan_notes = st.text_area("Additional Notes", height=100, key="plan_notes")
+    
+    if st.button("Save Session Plan", type="primary", key="save_plan"):
+        with pool.write() as conn:
+            conn.execute("""INSERT INTO session_plans (client_id, date, plan_intro, plan_checkin, plan_warmup, plan_main, 
+                                                       plan_reflection, plan_props, plan_closing, plan_notes, therapist_id) 
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                         (client_id, plan_date, plan_intro, plan_checkin, plan_warmup, plan_main, 
+                          plan_reflection, plan_props, plan_closing, plan_notes, st.session_state.user))
+        st.success("Session Plan Saved!")
+
+    st.divider()
+    st.subheader("Past Session Plans")
+    plans_hist = query_df("SELECT date, plan_main, plan_notes FROM session_plans WHERE client_id=? ORDER BY date DESC", params=[client_id])
+    st.dataframe(plans_hist, use_container_width=True)
+
+
+@st.fragment
+def diagnostic_history_tab(client_id):
+    pool = get_pool()
+    st.subheader("📜 Diagnostic History Log")
+    
+    col_diag_1, col_diag_2 = st.columns(2)
+    with col_diag_1:
+        diag_code = st.text_input("New Diagnosis Code (e.g., F33.2)", key="new_diag_code")
+        diag_desc = st.text_input("Diagnosis Description", key="new_diag_desc")
+    with col_diag_2:
+        diag_notes = st.text_area("Notes / Rationale for Diagnosis Change", height=100, key="new_diag_notes")
+
+    if st.button("Log New Diagnosis", type="primary", key="log_diag"):
+        if diag_code and diag_desc:
+            with pool.write() as conn:
+                conn.execute("INSERT INTO diagnostic_history (client_id, date, diagnosis_code, diagnosis_description, notes) VALUES (?, ?, ?, ?, ?)",
+                             (client_id, now_ts(), diag_code, diag_desc, diag_notes))
+            st.success(f"Diagnosis '{diag_desc}' logged.")
+        else:
+            st.error("Code and Description are required.")
+            
+    st.divider()
+    st.subheader("History")
+    diag_hist = query_df("SELECT date, diagnosis_code, diagnosis_description, notes FROM diagnostic_history WHERE client_id=? ORDER BY date DESC",
+                         params=[client_id], parse_dates={'date': {'format': 'ISO8601'}})
+    st.dataframe(diag_hist, use_container_width=True)
+
+
+@st.fragment
+def client_goals_tab(client_id):
+    pool = get_pool()
+    st.subheader("🎯 Assign Client-Specific Goals")
+    
+    all_goals_df = load_all_goals()
+    client_goal_descriptions = load_client_goals(client_id)
+    
+    # Available goals are those not yet assigned
+    assigned_goals = set(client_goal_descriptions)
+    available_goals = all_goals_df[~all_goals_df['description'].isin(assigned_goals)]
+    
+    st.markdown("#### Add Goal from Template")
+    
+    if available_goals.empty:
+        st.info("All available goal templates have been assigned to this client.")
+    else:
+        new_goals = st.multiselect("Select Goals to Assign", available_goals['description'])
+        if st.button("Assign Goals to Client", disabled=not new_goals):
+            # One statement for the whole batch; OR IGNORE skips goals assigned meanwhile
+            with pool.write() as conn:
+                conn.execute("INSERT OR IGNORE INTO client_goals (client_id, goal_description) SELECT ?, value FROM json_each(?)",
+                             (client_id, json.dumps(new_goals)))
+            load_client_goals.clear(client_id)
+            st.success(f"{len(new_goals)} goal(s) assigned.")
+            st.rerun()
+
+    st.divider()
+    st.markdown("#### Currently Assigned Goals")
+    if not client_goal_descriptions:
+        st.info("No goals assigned. Use the form above to assign them.")
+    else:
+        # One editor with a checkbox column instead of a Remove button per goal
+        editor_key = f"client_goals_editor_{client_id}"
+        edited = st.data_editor(pd.DataFrame({"Goal": client_goal_descriptions, "Remove": False}),
+                                key=editor_key, hide_index=True, use_container_width=True, disabled=["Goal"])
+        removed = edited.loc[edited["Remove"], "Goal"].tolist()
+        st.button("Remove Selected Goals", key="remove_goals", disabled=not removed, on_click=delete_selected_rows,
+                  args=("DELETE FROM client_goals WHERE client_id=? AND goal_description IN (SELECT value FROM json_each(?))",
+                        (client_id, json.dumps(removed)), editor_key, f"{len(removed)} goal(s) removed.",
+                        lambda: load_client_goals.clear(client_id)))
+
+
+@st.fragment
+def client_files_tab(client_id):
+    pool = get_pool()
+    st.subheader("🖼️ Client Files & Art Upload")
+    
+    uploaded_file = st.file_uploader("Upload File (Max 2MB)", type=["pdf", "png", "jpg", "jpeg"])
+    
+    if uploaded_file is not None:
+        if uploaded_file.size > 2 * 1024 * 1024:
+            st.error("File size exceeds 2MB limit.")
+        else:
+            if st.button(f"Save '{uploaded_file.name}'"):
+                with pool.write() as conn:
+                    save_file_blob(conn, client_id, uploaded_file)
+                st.success(f"File '{uploaded_file.name}' saved.")
+                
+    st.divider()
+    st.subheader("Saved Files")
+    # Metadata only; each file's bytes are fetched on demand by get_file_blob
+    files_df = query_df("SELECT id, filename, filetype, upload_date FROM client_files WHERE client_id=? ORDER BY upload_date DESC",
+                        params=[client_id], parse_dates={'upload_date': {'format': 'ISO8601'}})
+    
+    if files_df.empty:
+        st.info("No files saved yet.")
+    else:
+        editor_key = f"client_files_editor_{client_id}"
+        edited = st.data_editor(
+            files_df.assign(View=False, Delete=False),
+            key=editor_key, hide_index=True, use_container_width=True,
+            disabled=["filename", "filetype", "upload_date"],
+            column_config={"id": None, "filename": "File", "filetype": "Type", "upload_date": st.column_config.DateColumn("Uploaded")})
+
+        # Bytes are only read for files the user chose to open
+        for row in edited[edited["View"]].to_dict('records'):
+            display_file(row['filename'], get_file_blob(row['id']), row['filetype'])
+
+        deleted = edited.loc[edited["Delete"], "id"].tolist()
+        st.button("Delete Selected Files", key="delete_files", disabled=not deleted, on_click=delete_selected_rows,
+                  args=("DELETE FROM client_files WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(deleted),), editor_key, f"{len(deleted)} file(s) deleted."))
+
+
+@st.fragment
+def self_checkin_tab(client_id):
+    pool = get_pool()
+    st.subheader("🧘 Therapist Self Check-In")
+    
+    col_e, col_f = st.columns(2)
+    with col_e:
+        energy_rating = st.slider("Energy Level (1=Low, 10=High)", 1, 10, 5, key="self_energy")
+    with col_f:
+        focus_rating = st.slider("Focus Level (1=Distracted, 10=Sharp)", 1, 10, 5, key="self_focus")
+        
+    checkin_notes = st.text_area("Notes / Reflections on the session or client dynamics", height=150, key="self_notes")
+    
+    if st.button("Save Self Check-In", type="primary", key="save_checkin"):
+        with pool.write() as conn:
+            conn.execute("INSERT INTO therapist_checkin (client_id, date, therapist_id, energy_rating, focus_rating, notes) VALUES (?, ?, ?, ?, ?, ?)",
+                         (client_id, now_ts(), st.session_state.user, energy_rating, focus_rating, checkin_notes))
+        st.success("Self Check-In saved.")
+        
+    st.divider()
+    st.subheader("Past Check-Ins")
+    # Rolling averages over the last 7 check-ins are computed by a window in SQLite
+    checkin_hist = query_df("""
+        SELECT date, energy_rating, focus_rating, notes,
+               AVG(energy_rating) OVER w AS "Energy (7 check-in avg)",
+               AVG(focus_rating) OVER w AS "Focus (7 check-in avg)"
+        FROM therapist_checkin WHERE client_id=?
+        WINDOW w AS (ORDER BY date ROWS 6 PRECEDING)
+        ORDER BY date DESC""", params=[client_id], parse_dates={'date': {'format': 'ISO8601'}})
+    if len(checkin_hist) > 1:
+        fig = px.line(checkin_hist, x='date', y=["Energy (7 check-in avg)", "Focus (7 check-in avg)"],
+                      markers=True, title="Energy & Focus Trend")
+        st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(checkin_hist[['date', 'energy_rating', 'focus_rating', 'notes']], use_container_width=True)
+
+
+@st.fragment
+def resources_tab(client_id):
+    pool = get_pool()
+    st.subheader("📚 Client Resource List")
+    
+    col_r_title, col_r_url = st.columns(2)
+    with col_r_title:
+        resource_title = st.text_input("Resource Title/Name", key="res_title")
+    with col_r_url:
+        resource_url = st.text_input("Resource Link (URL)", key="res_url")
+        
+    resource_notes = st.text_area("Description / When to use / Homework notes", height=100, key="res_notes")
+    
+    if st.button("Add Resource", type="primary", key="add_res"):
+        if resource_title:
+            with pool.write() as conn:
+                conn.execute("INSERT INTO session_resources (client_id, title, url, notes, therapist_id) VALUES (?, ?, ?, ?, ?)",
+                             (client_id, resource_title, resource_url, resource_notes, st.session_state.user))
+            st.success(f"Resource '{resource_title}' added.")
+        else:
+            st.error("Resource Title is required.")
+            
+    st.divider()
+    st.subheader("Assigned Resources")
+    resources_df = query_df("SELECT id, title, url, notes FROM session_resources WHERE client_id=? ORDER BY id DESC", params=[client_id])
+    
+    if not resources_df.empty:
+        editor_key = f"resources_editor_{client_id}"
+        edited = st.data_editor(
+            resources_df.assign(Delete=False), key=editor_key, hide_index=True, use_container_width=True,
+            disabled=["title", "url", "notes"],
+            column_config={"id": None, "title": "Resource", "url": st.column_config.LinkColumn("Link"), "notes": "Notes"})
+        deleted = edited.loc[edited["Delete"], "id"].tolist()
+        st.button("Delete Selected Resources", key="delete_resources", disabled=not deleted, on_click=delete_selected_rows,
+                  args=("DELETE FROM session_resources WHERE id IN (SELECT value FROM json_each(?))",
+                        (json.dumps(deleted),), editor_key, f"{len(deleted)} resource(s) deleted."))
+
 
 # --- MAIN APP ---
 def main_app():
-    conn = get_connection()
+    pool = get_pool()
     
     with st.sidebar:
         st.title(f"Welcome, {st.session_state.user}")
@@ -290,67 +883,42 @@ def main_app():
         st.header("Practice Overview")
         
         # --- 🚨 RISK ALERT WIDGET ---
-        risk_df = pd.read_sql(f"""
-            SELECT c.name, s.assessment, s.date, c.id
-            FROM soap_notes s 
-            JOIN clients c ON s.client_id = c.id 
-            WHERE c.therapist_id='{st.session_state.user}' 
-            ORDER BY s.date DESC
-        """, conn)
-        
-        clients_df_status = pd.read_sql(f"SELECT id, name, status FROM clients WHERE therapist_id='{st.session_state.user}'", conn)
+        high_risk_clients = fetch_risk_df(st.session_state.user)
         
-        if not risk_df.empty:
-            # Keep only the most recent note for each client
-            latest_notes = risk_df.drop_duplicates(subset=['name'], keep='first')
-            risk_keywords = ["Suicidal Ideation", "Homicidal Ideation", "Self-Harm Risk", "Grave Disability"]
-            
-            high_risk_clients = latest_notes[latest_notes['assessment'].apply(
-                lambda x: any(risk in x for risk in risk_keywords) if x else False
-            )]
+        if not high_risk_clients.empty:
+            st.error("🚨 **ATTENTION: High Risk Flags Detected in Latest Notes**")
             
-            if not high_risk_clients.empty:
-                st.error("🚨 **ATTENTION: High Risk Flags Detected in Latest Notes**")
+            for i, row in high_risk_clients.iterrows():
+                col_risk_name, col_risk_form = st.columns([3, 4])
+                client_id_risk = int(row['id'])
+                current_status = row['status']
                 
-                for i, row in high_risk_clients.iterrows():
-                    col_risk_name, col_risk_status, col_risk_button = st.columns([3, 2, 2])
-                    client_id_risk = row['id']
-                    
-                    # Fetch current status for display
-                    current_status = clients_df_status[clients_df_status['id'] == client_id_risk]['status'].iloc[0]
-                    
-                    with col_risk_name:
-                        try:
-                            risk_status = row['assessment'].split('|')[0] 
-                        except:
-                            risk_status = row['assessment']
-                            
-                        st.markdown(f"**{row['name']}** (Last note: {row['date']})")
-                        st.caption(f"🚩 Flag: {risk_status}")
-                    
+                with col_risk_name:
+                    # dict.fromkeys drops repeats of a flag while keeping first-seen order
+                    risk_status = ", ".join(dict.fromkeys(_RISK_RE.findall(row['assessment'])))
+                        
+                    st.markdown(f"**{row['name']}** (Last note: {row['date']})")
+                    st.caption(f"🚩 Flag: {risk_status}")
+                
+                # Form keeps the selectbox from rerunning the Dashboard until Apply is pressed
+                with col_risk_form, st.form(key=f"risk_form_{client_id_risk}", border=False):
+                    col_risk_status, col_risk_button = st.columns(2)
                     with col_risk_status:
-                        new_status = st.selectbox(
+                        st.selectbox(
                             "Update Status", 
-                            ["Active", "Terminated", "No-Show", "Inactive"],
-                            index=["Active", "Terminated", "No-Show", "Inactive"].index(current_status),
+                            STATUS_CHOICES,
+                            index=STATUS_INDEX.get(current_status, 0),
                             key=f"risk_status_{client_id_risk}"
                         )
-                        
                     with col_risk_button:
-                        if st.button("Apply Update", key=f"risk_update_{client_id_risk}"):
-                            conn.execute("UPDATE clients SET status=? WHERE id=?", (new_status, client_id_risk))
-                            conn.commit()
-                            st.success(f"Status for {row['name']} updated to {new_status}.")
-                            st.rerun()
-                    
-                    st.divider()
+                        st.form_submit_button("Apply Update", on_click=update_risk_status,
+                                              args=(client_id_risk, row['name'], f"risk_status_{client_id_risk}"))
+                
+                st.divider()
 
         # Fetch Quick Stats
-        client_count_df = pd.read_sql(f"SELECT count(*) FROM clients WHERE therapist_id='{st.session_state.user}'", conn)
-        client_count = client_count_df.iloc[0,0] if not client_count_df.empty else 0
-        
-        session_count_df = pd.read_sql(f"SELECT count(*) FROM sessions WHERE therapist_id='{st.session_state.user}'", conn)
-        session_count = session_count_df.iloc[0,0] if not session_count_df.empty else 0
+        client_count = fetch_client_count(st.session_state.user)
+        session_count = fetch_session_count(st.session_state.user)
         
         col1, col2, col3 = st.columns(3)
         col1.metric("Total Clients", client_count)
@@ -358,11 +926,7 @@ def main_app():
         col3.metric("Date", datetime.now().strftime("%Y-%m-%d"))
         
         st.subheader("Recent Sessions")
-        recent = pd.read_sql(f"""
-            SELECT c.name, s.date, s.session_number, s.session_time, s.rating 
-            FROM sessions s JOIN clients c ON s.client_id = c.id 
-            WHERE s.therapist_id='{st.session_state.user}' 
-            ORDER BY s.date DESC LIMIT 5""", conn)
+        recent = fetch_recent_sessions(st.session_state.user)
         st.dataframe(recent, use_container_width=True)
 
     # --- MY SITES ---
@@ -377,31 +941,32 @@ def main_app():
             
             if st.button("Save Site"):
                 if site_name:
-                    conn.execute("INSERT INTO sites (name, address, type, therapist_id) VALUES (?, ?, ?, ?)",
-                                 (site_name, site_address, site_type, st.session_state.user))
-                    conn.commit()
+                    with pool.write() as conn:
+                        conn.execute("INSERT INTO sites (name, address, type, therapist_id) VALUES (?, ?, ?, ?)",
+                                     (site_name, site_address, site_type, st.session_state.user))
+                    load_sites.clear()
                     st.success(f"Site '{site_name}' added.")
-                    st.rerun()
                 else:
                     st.error("Site Name cannot be empty.")
 
         st.divider()
         st.subheader("🌐 Existing Sites & Caseload Breakdown")
         
-        sites_df = pd.read_sql(f"SELECT * FROM sites WHERE therapist_id='{st.session_state.user}'", conn)
-        clients_all_df = pd.read_sql(f"SELECT id, name, site_id, status FROM clients WHERE therapist_id='{st.session_state.user}'", conn)
+        sites_df = load_sites(st.session_state.user)
+        clients_all_df = load_clients(st.session_state.user)
+        # One grouping pass instead of a boolean mask over every client per site
+        clients_by_site = dict(list(clients_all_df.groupby('site_id')))
 
         if sites_df.empty:
             st.info("No sites defined yet. Add a site above.")
         else:
-            for index, site in sites_df.iterrows():
-                site_id = site['id']
+            for site in sites_df.itertuples(index=False):
+                site_id = site.id
                 
-                # Filter clients for the current site
-                site_clients_df = clients_all_df[clients_all_df['site_id'] == site_id]
+                site_clients_df = clients_by_site.get(site_id, clients_all_df.iloc[0:0])
                 
-                with st.expander(f"**{site['name']}** ({site['type']}) - {len(site_clients_df)} Clients"):
-                    st.caption(f"Address/Details: {site['address']}")
+                with st.expander(f"**{site.name}** ({site.type}) - {len(site_clients_df)} Clients"):
+                    st.caption(f"Address/Details: {site.address}")
                     
                     if site_clients_df.empty:
                         st.info("No clients currently assigned to this site.")
@@ -412,59 +977,67 @@ def main_app():
                         st.dataframe(client_list, use_container_width=True, hide_index=True)
 
                     # Option to Delete Site
-                    if st.button(f"Delete Site: {site['name']}", key=f"delete_site_{site_id}"):
+                    if st.button(f"Delete Site: {site.name}", key=f"delete_site_{site_id}"):
                         if len(site_clients_df) > 0:
                              st.error("Cannot delete site: first unassign all clients.")
                         else:
-                            conn.execute("DELETE FROM sites WHERE id=?", (site_id,))
-                            conn.commit()
-                            st.warning(f"Site '{site['name']}' deleted.")
+                            with pool.write() as conn:
+                                conn.execute("DELETE FROM sites WHERE id=?", (site_id,))
+                            load_sites.clear()
+                            st.warning(f"Site '{site.name}' deleted.")
                             st.rerun()
 
     # --- NEW SESSION (Goals and Progress Entry) ---
     elif menu == "New Session":
         st.header("📝 Enter Session Data")
         
-        clients = pd.read_sql(f"SELECT id, name, status FROM clients WHERE therapist_id='{st.session_state.user}' AND status='Active'", conn)
+        clients = load_clients(st.session_state.user)
+        clients = clients[clients['status'] == 'Active']
         
         if clients.empty:
             st.warning("Please add an Active client in 'Client Records' first.")
         else:
-            client_map = dict(zip(clients['name'], clients['id']))
-            selected_client_name = st.selectbox("Select Participant", clients['name'])
-            client_id = client_map[selected_client_name]
+            # name -> id lookup; keep='last' matches the dict it replaces when names repeat
+            client_ids = clients.drop_duplicates('name', keep='last').set_index('name')['id']
+            selected_client_name = st.selectbox("Select Participant", client_ids.index)
+            client_id = int(client_ids[selected_client_name])
             
             col_date, col_time, col_num = st.columns(3)
             with col_date:
                 sess_date = st.date_input("Date")
             with col_time:
-                sess_time = st.time_input("Session Time", time(10, 00)).strftime("%H:%M") # Added time option
+                sess_time = st.time_input("Session Time", time(10, 00)) # Added time option
             with col_num:
                 sess_num = st.number_input("Session Number", min_value=1, value=1)
             
             rating = st.slider("Progress Rating (1-10)", 1, 10, 5) # Progress Tracking (Numerical)
             
             # Fetch Client-Specific Goals
-            client_goals_df = pd.read_sql(f"SELECT goal_description FROM client_goals WHERE client_id={client_id}", conn)
+            client_goals = load_client_goals(client_id)
             
-            if client_goals_df.empty:
+            if not client_goals:
                  st.warning("No specific goals assigned to this client. Navigate to Client Records -> Client Goals to assign them.")
-                 all_goals = pd.read_sql("SELECT description FROM goals", conn)
+                 all_goals = load_all_goals()
                  available_goals = all_goals['description']
             else:
-                 available_goals = client_goals_df['goal_description']
+                 available_goals = client_goals
             
             goals_selected = st.multiselect("Select Goals Addressed", available_goals)
             
             progress_notes = st.text_area("**Goals Achieved / Progress Noted**") # Progress Notes Entry
             
             if st.button("Save Session", type="primary"):
-                c = conn.cursor()
                 goals_str = ", ".join(goals_selected)
-                c.execute("""INSERT INTO sessions (client_id, date, session_number, session_time, goals_selected, progress_notes, rating, therapist_id)
-                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", 
-                             (client_id, sess_date, sess_num, sess_time, goals_str, progress_notes, rating, st.session_state.user))
-                conn.commit()
+                # Same UTC epoch strftime('%s') produces for the backfilled rows
+                sess_ts = int(datetime.combine(sess_date, sess_time, tzinfo=timezone.utc).timestamp())
+                with pool.write() as conn:
+                    conn.execute("""INSERT INTO sessions (client_id, date, session_number, session_time, date_ts, goals_selected, progress_notes, rating, therapist_id)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
+                                 (client_id, sess_date, sess_num, sess_time.strftime("%H:%M"), sess_ts, goals_str, progress_notes, rating, st.session_state.user))
+                fetch_session_count.clear()
+                fetch_goal_counts.clear()
+                load_sessions.clear()
+                fetch_recent_sessions.clear()
                 st.success("Session Saved Successfully!")
 
     # --- CLIENT RECORDS (Client Profile, SOAP, History) ---
@@ -472,9 +1045,9 @@ def main_app():
         st.header("📂 Client Details")
         
         # --- Add New Client ---
-        sites_available = pd.read_sql(f"SELECT id, name FROM sites WHERE therapist_id='{st.session_state.user}'", conn)
-        site_map = dict(zip(sites_available['name'], sites_available['id']))
-        site_names = sites_available['name'].tolist()
+        sites_available = load_sites(st.session_state.user)
+        site_ids = sites_available.drop_duplicates('name', keep='last').set_index('name')['id']
+        site_names = site_ids.index.tolist()
         
         with st.expander("➕ Add New Client"):
             new_name = st.text_input("Client Name")
@@ -483,24 +1056,25 @@ def main_app():
             
             if site_names:
                 selected_site_name = st.selectbox("Associated Session Site", site_names)
-                new_site_id = site_map[selected_site_name]
+                new_site_id = int(site_ids[selected_site_name])
             else:
                 st.warning("Please define at least one site in 'My Sites' before adding a client.")
                 new_site_id = None
                 
             if st.button("Create Client"):
                 if new_name and new_site_id is not None:
-                    c = conn.cursor()
-                    c.execute("INSERT INTO clients (name, dob, diagnosis, site_id, therapist_id, status) VALUES (?, ?, ?, ?, ?, ?)", 
-                              (new_name, new_dob, new_diag, new_site_id, st.session_state.user, 'Active'))
-                    conn.commit()
+                    with pool.write() as conn:
+                        conn.execute("INSERT INTO clients (name, dob, diagnosis, site_id, therapist_id, status) VALUES (?, ?, ?, ?, ?, ?)", 
+                                     (new_name, new_dob, new_diag, new_site_id, st.session_state.user, 'Active'))
+                    fetch_client_count.clear()
+                    load_clients.clear()
                     st.success("Client Added")
                     st.rerun()
                 elif not new_name:
                     st.error("Client Name is required.")
 
         # --- Select Existing Client ---
-        clients = pd.read_sql(f"SELECT * FROM clients WHERE therapist_id='{st.session_state.user}'", conn)
+        clients = load_clients(st.session_state.user)
         if not clients.empty:
             selected_client_name = st.selectbox("Select Client to View", clients['name'])
             client_data = clients[clients['name'] == selected_client_name].iloc[0]
@@ -527,14 +1101,10 @@ def main_app():
                 # Site Display (FIXED: Handling nan/None in site_id)
                 site_name_display = "N/A (Update Below)"
                 if client_data['site_id'] is not None and not pd.isna(client_data['site_id']):
-                    site_id_int = int(client_data['site_id'])
-                    try:
-                        site_info = pd.read_sql(f"SELECT name, type FROM sites WHERE id={site_id_int}", conn).iloc[0]
-                        site_name_display = f"{site_info['name']} ({site_info['type']})"
-                    except IndexError:
+                    if pd.isna(client_data['site_name']):
                         site_name_display = "ID Missing/Invalid"
-                    except pd.errors.DatabaseError:
-                        site_name_display = "DB Error"
+                    else:
+                        site_name_display = f"{client_data['site_name']} ({client_data['site_type']})"
                 
                 with col_site: st.markdown(f"**Primary Site:** {site_name_display}")
                 with col_status: st.markdown(f"**Current Status:** :green[{client_data['status']}]" if client_data['status'] == 'Active' else f"**Current Status:** :red[{client_data['status']}]")
@@ -548,24 +1118,28 @@ def main_app():
                 with col_stat_up:
                     new_status = st.selectbox(
                         "Update Client Status", 
-                        ["Active", "Terminated", "No-Show", "Inactive"],
-                        index=["Active", "Terminated", "No-Show", "Inactive"].index(client_data['status'])
+                        STATUS_CHOICES,
+                        index=STATUS_INDEX.get(client_data['status'], 0)
                     )
                     if st.button("Update Status"):
-                        conn.execute("UPDATE clients SET status=? WHERE id=?", (new_status, client_id))
-                        conn.commit()
+                        with pool.write() as conn:
+                            conn.execute("UPDATE clients SET status=? WHERE id=?", (new_status, client_id))
+                        fetch_risk_df.clear()
+                        load_clients.clear()
                         st.success(f"Status updated to {new_status}")
                         st.rerun()
                 
                 with col_site_up:
-                    current_site_index = site_names.index(sites_available[sites_available['id'] == client_data['site_id']]['name'].iloc[0]) if client_data['site_id'] is not None and not sites_available.empty and client_data['site_id'] in sites_available['id'].values else 0
+                    # Reverse lookup by id on the same Series; -1 (no/unknown site) falls back to the first option
+                    current_site_index = max(int(pd.Index(site_ids).get_indexer([client_data['site_id']])[0]), 0)
                     
                     new_site_name = st.selectbox("Change Associated Session Site", site_names, index=current_site_index)
-                    new_site_id = site_map[new_site_name]
+                    new_site_id = int(site_ids[new_site_name])
                     
                     if st.button("Update Site"):
-                        conn.execute("UPDATE clients SET site_id=? WHERE id=?", (new_site_id, client_id))
-                        conn.commit()
+                        with pool.write() as conn:
+                            conn.execute("UPDATE clients SET site_id=? WHERE id=?", (new_site_id, client_id))
+                        load_clients.clear()
                         st.success(f"Primary Site updated to {new_site_name}")
                         st.rerun()
 
@@ -577,8 +1151,9 @@ def main_app():
                 curr_hist = client_data['history'] if client_data['history'] else ""
                 new_hist = st.text_area("Update History Notes", value=curr_hist, height=150)
                 if st.button("Update History Notes"):
-                    conn.execute("UPDATE clients SET history=? WHERE id=?", (new_hist, client_id))
-                    conn.commit()
+                    with pool.write() as conn:
+                        conn.execute("UPDATE clients SET history=? WHERE id=?", (new_hist, client_id))
+                    load_clients.clear()
                     st.success("History Notes Updated")
                     st.rerun()
                     
@@ -590,404 +1165,87 @@ def main_app():
                 
                 if delete_confirm == client_data['name']:
                     if st.button(f"PERMANENTLY DELETE {client_data['name']}", type="secondary"):
-                        # Delete from all tables
-                        conn.execute("DELETE FROM clients WHERE id=?", (client_id,))
-                        conn.execute("DELETE FROM sessions WHERE client_id=?", (client_id,))
-                        conn.execute("DELETE FROM soap_notes WHERE client_id=?", (client_id,))
-                        conn.execute("DELETE FROM client_goals WHERE client_id=?", (client_id,))
-                        conn.execute("DELETE FROM diagnostic_history WHERE client_id=?", (client_id,))
-                        conn.execute("DELETE FROM client_files WHERE client_id=?", (client_id,))
-                        conn.execute("DELETE FROM therapist_checkin WHERE client_id=?", (client_id,))
-                        conn.execute("DELETE FROM session_resources WHERE client_id=?", (client_id,))
-                        conn.execute("DELETE FROM session_plans WHERE client_id=?", (client_id,))
-                        conn.commit()
+                        # Child tables cascade via ON DELETE CASCADE
+                        with pool.write() as conn:
+                            conn.execute("DELETE FROM clients WHERE id=?", (client_id,))
+                        fetch_risk_df.clear()
+                        fetch_client_count.clear()
+                        fetch_session_count.clear()
+                        fetch_goal_counts.clear()
+                        load_sessions.clear()
+                        fetch_recent_sessions.clear()
+                        load_client_goals.clear(client_id)
+                        load_clients.clear()
                         st.success(f"Client {client_data['name']} and all associated records have been permanently deleted.")
                         st.rerun()
             
             # --- Tab 2: SOAP Notes ---
             with tab2:
-                st.subheader("📝 Add SOAP Note")
-                # Subjective
-                st.markdown("#### Subjective (Client Reports)")
-                col_s1, col_s2 = st.columns(2)
-                with col_s1:
-                    reported_mood = st.selectbox("Reported Mood", 
-                        ["Euthymic/Neutral", "Depressed/Sad", "Anxious/Worried", "Angry/Irritable", "Euphoric/Manic", "Fluctuating"], key="soap_mood")
-                    symptoms = st.multiselect("Presenting Symptoms", 
-                        ["Sleep Disturbance", "Appetite Changes", "Low Energy", "Panic Attacks", "Flashbacks", "Social Withdrawal", "Excessive Guilt", "Substance Use"], key="soap_symptoms")
-                with col_s2:
-                    s_narrative = st.text_area("Subjective Narrative (Quotes/Context)", height=100, key="soap_snarrative")
-                final_subj = f"Mood: {reported_mood} | Symptoms: {', '.join(symptoms)}\nNotes: {s_narrative}"
-
-                st.divider()
-
-                # Objective
-                st.markdown("#### Objective (Therapist Observations)")
-                col_o1, col_o2 = st.columns(2)
-                with col_o1:
-                    affect = st.selectbox("Affect", ["Appropriate/Congruent", "Flat/Blunted", "Labile", "Constricted", "Inappropriate"], key="soap_affect")
-                    orientation = st.multiselect("Orientation", ["Person", "Place", "Time", "Situation"], default=["Person", "Place", "Time", "Situation"], key="soap_orientation")
-                    appearance = st.multiselect("Appearance/Behavior", ["Well-Groomed", "Disheveled", "Psychomotor Agitation", "Psychomotor Retardation", "Poor Eye Contact", "Cooperative"], key="soap_appearance")
-                with col_o2:
-                    o_narrative = st.text_area("Objective Observations (Details)", height=150, key="soap_onarrative")
-                final_obj = f"Affect: {affect} | Orientation: {', '.join(orientation)} | Appearance: {', '.join(appearance)}\nNotes: {o_narrative}"
-
-                st.divider()
-
-                # Assessment & Plan
-                col_ap1, col_ap2 = st.columns(2)
-                with col_ap1:
-                    st.markdown("#### Assessment")
-                    risk_status = st.multiselect("Risk Assessment", ["No Current Risk", "Suicidal Ideation", "Homicidal Ideation", "Self-Harm Risk", "Grave Disability"], key="soap_risk")
-                    s_assess = st.text_area("Clinical Impression/Analysis", height=100, key="soap_assess")
-                    final_assess = f"Risk: {', '.join(risk_status)} | Analysis: {s_assess}"
-                
-                with col_ap2:
-                    st.markdown("#### Plan")
-                    next_sess = st.date_input("Next Session Date", key="soap_nextdate")
-                    s_plan = st.text_area("Interventions & Homework", height=100, key="soap_plan")
-                    final_plan = f"Next Session: {next_sess}\nPlan: {s_plan}"
-
-                if st.button("Save SOAP Note", type="primary", key="save_soap"):
-                    conn.execute("INSERT INTO soap_notes (client_id, date, subjective, objective, assessment, plan) VALUES (?, ?, ?, ?, ?, ?)",
-                                 (client_id, datetime.now(), final_subj, final_obj, final_assess, final_plan))
-                    conn.commit()
-                    st.success("SOAP Note Saved Successfully!")
-                    st.rerun()
-                
-                st.divider()
-                st.subheader("📜 Past SOAP Notes")
-                soap_hist = pd.read_sql(f"SELECT date, subjective, objective, assessment, plan FROM soap_notes WHERE client_id={client_id} ORDER BY date DESC", conn)
-                
-                for i, note in soap_hist.iterrows():
-                    with st.expander(f"Note from {note['date']}"):
-                        st.markdown(f"**S:** {note['subjective']}")
-                        st.markdown(f"**O:** {note['objective']}")
-                        st.markdown(f"**A:** {note['assessment']}")
-                        st.markdown(f"**P:** {note['plan']}")
+                soap_notes_tab(client_id)
 
             # --- Tab 3: Session Plans (Structured Planning) ---
             with tab3:
-                st.subheader("🗓️ Create or Update Session Plan")
-                
-                plan_date = st.date_input("Plan Date", key="plan_date")
-                
-                st.markdown("---")
-                
-                col_plan_1, col_plan_2, col_plan_3 = st.columns(3)
-                
-                with col_plan_1:
-                    plan_intro = st.text_area("1. Introduction/Arrival", height=100, key="plan_intro")
-                    plan_checkin = st.text_area("2. Check In", height=100, key="plan_checkin")
-                
-                with col_plan_2:
-                    plan_warmup = st.text_area("3. Warm Up", height=100, key="plan_warmup")
-                    plan_main = st.text_area("4. Main Theme/Activity", height=100, key="plan_main")
-                
-                with col_plan_3:
-                    plan_reflection = st.text_area("5. Reflection", height=100, key="plan_reflection")
-                    plan_closing = st.text_area("6. Closing", height=100, key="plan_closing")
-
-                st.markdown("---")
-                
-                col_props, col_notes = st.columns(2)
-                with col_props:
-                    plan_props = st.text_area("Props Used (Materials needed)", height=100, key="plan_props")
-                with col_notes:
-                    plan_notes = st.text_area("Additional Notes", height=100, key="plan_notes")
-                
-                if st.button("Save Session Plan", type="primary", key="save_plan"):
-                    conn.execute("""INSERT INTO session_plans (client_id, date, plan_intro, plan_checkin, plan_warmup, plan_main, 
-                                                               plan_reflection, plan_props, plan_closing, plan_notes, therapist_id) 
-                                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                                 (client_id, plan_date, plan_intro, plan_checkin, plan_warmup, plan_main, 
-                                  plan_reflection, plan_props, plan_closing, plan_notes, st.session_state.user))
-                    conn.commit()
-                    st.success("Session Plan Saved!")
-                    st.rerun()
-
-                st.divider()
-                st.subheader("Past Session Plans")
-                plans_hist = pd.read_sql(f"SELECT date, plan_main, plan_notes FROM session_plans WHERE client_id={client_id} ORDER BY date DESC", conn)
-                st.dataframe(plans_hist, use_container_width=True)
+                session_plans_tab(client_id)
 
 
             # --- Tab 4: Diagnostic History ---
             with tab4:
-                st.subheader("📜 Diagnostic History Log")
-                
-                col_diag_1, col_diag_2 = st.columns(2)
-                with col_diag_1:
-                    diag_code = st.text_input("New Diagnosis Code (e.g., F33.2)", key="new_diag_code")
-                    diag_desc = st.text_input("Diagnosis Description", key="new_diag_desc")
-                with col_diag_2:
-                    diag_notes = st.text_area("Notes / Rationale for Diagnosis Change", height=100, key="new_diag_notes")
-
-                if st.button("Log New Diagnosis", type="primary", key="log_diag"):
-                    if diag_code and diag_desc:
-                        conn.execute("INSERT INTO diagnostic_history (client_id, date, diagnosis_code, diagnosis_description, notes) VALUES (?, ?, ?, ?, ?)",
-                                     (client_id, datetime.now(), diag_code, diag_desc, diag_notes))
-                        conn.commit()
-                        st.success(f"Diagnosis '{diag_desc}' logged.")
-                        st.rerun()
-                    else:
-                        st.error("Code and Description are required.")
-                        
-                st.divider()
-                st.subheader("History")
-                diag_hist = pd.read_sql(f"SELECT date, diagnosis_code, diagnosis_description, notes FROM diagnostic_history WHERE client_id={client_id} ORDER BY date DESC", conn)
-                st.dataframe(diag_hist, use_container_width=True)
+                diagnostic_history_tab(client_id)
 
             # --- Tab 5: Client Goals ---
             with tab5:
-                st.subheader("🎯 Assign Client-Specific Goals")
-                
-                all_goals_df = pd.read_sql("SELECT category, description FROM goals", conn)
-                client_goals_df = pd.read_sql(f"SELECT goal_description FROM client_goals WHERE client_id={client_id}", conn)
-                client_goal_descriptions = client_goals_df['goal_description'].tolist()
-                
-                # Available goals are those not yet assigned
-                assigned_goals = set(client_goal_descriptions)
-                available_goals = all_goals_df[~all_goals_df['description'].isin(assigned_goals)]
-                
-                st.markdown("#### Add Goal from Template")
-                
-                if available_goals.empty:
-                    st.info("All available goal templates have been assigned to this client.")
-                else:
-                    new_goal = st.selectbox("Select Goal to Assign", available_goals['description'])
-                    if st.button("Assign Goal to Client"):
-                        conn.execute("INSERT INTO client_goals (client_id, goal_description) VALUES (?, ?)", (client_id, new_goal))
-                        conn.commit()
-                        st.success(f"Goal '{new_goal}' assigned.")
-                        st.rerun()
-
-                st.divider()
-                st.markdown("#### Currently Assigned Goals")
-                if client_goals_df.empty:
-                    st.info("No goals assigned. Use the form above to assign them.")
-                else:
-                    for goal_desc in client_goal_descriptions:
-                        col_g_desc, col_g_del = st.columns([5, 1])
-                        with col_g_desc:
-                            st.write(f"- {goal_desc}")
-                        with col_g_del:
-                            if st.button("Remove", key=f"del_goal_{re.sub(r'[^a-zA-Z0-9]', '', goal_desc)[:10]}"):
-                                conn.execute("DELETE FROM client_goals WHERE client_id=? AND goal_description=?", (client_id, goal_desc))
-                                conn.commit()
-                                st.warning("Goal removed.")
-                                st.rerun()
-
+                client_goals_tab(client_id)
 
             # --- Tab 6: Files/Art ---
             with tab6:
-                st.subheader("🖼️ Client Files & Art Upload")
-                
-                uploaded_file = st.file_uploader("Upload File (Max 2MB)", type=["pdf", "png", "jpg", "jpeg"])
-                
-                if uploaded_file is not None:
-                    if uploaded_file.size > 2 * 1024 * 1024:
-                        st.error("File size exceeds 2MB limit.")
-                    else:
-                        if st.button(f"Save '{uploaded_file.name}'"):
-                            file_data_b64 = get_base64_data(uploaded_file)
-                            conn.execute("INSERT INTO client_files (client_id, filename, filetype, filedata, upload_date) VALUES (?, ?, ?, ?, ?)",
-                                         (client_id, uploaded_file.name, uploaded_file.type, file_data_b64, datetime.now()))
-                            conn.commit()
-                            st.success(f"File '{uploaded_file.name}' saved.")
-                            st.rerun()
-                            
-                st.divider()
-                st.subheader("Saved Files")
-                files_df = pd.read_sql(f"SELECT id, filename, filetype, filedata, upload_date FROM client_files WHERE client_id={client_id} ORDER BY upload_date DESC", conn)
-                
-                if files_df.empty:
-                    st.info("No files saved yet.")
-                else:
-                    for i, row in files_df.iterrows():
-                        col_f_name, col_f_view, col_f_del = st.columns([3, 1, 1])
-                        with col_f_name:
-                            st.write(f"**{row['filename']}** ({row['filetype']})")
-                            st.caption(f"Uploaded: {row['upload_date'].split(' ')[0]}")
-                        
-                        with col_f_view:
-                            display_file(row['filename'], row['filedata'], row['filetype'])
-
-                        with col_f_del:
-                            if st.button("Delete", key=f"del_file_{row['id']}"):
-                                conn.execute("DELETE FROM client_files WHERE id=?", (row['id'],))
-                                conn.commit()
-                                st.warning(f"File '{row['filename']}' deleted.")
-                                st.rerun()
+                client_files_tab(client_id)
 
             # --- Tab 7: Therapist Self Check-In ---
             with tab7:
-                st.subheader("🧘 Therapist Self Check-In")
-                
-                col_e, col_f = st.columns(2)
-                with col_e:
-                    energy_rating = st.slider("Energy Level (1=Low, 10=High)", 1, 10, 5, key="self_energy")
-                with col_f:
-                    focus_rating = st.slider("Focus Level (1=Distracted, 10=Sharp)", 1, 10, 5, key="self_focus")
-                    
-                checkin_notes = st.text_area("Notes / Reflections on the session or client dynamics", height=150, key="self_notes")
-                
-                if st.button("Save Self Check-In", type="primary", key="save_checkin"):
-                    conn.execute("INSERT INTO therapist_checkin (client_id, date, therapist_id, energy_rating, focus_rating, notes) VALUES (?, ?, ?, ?, ?, ?)",
-                                 (client_id, datetime.now(), st.session_state.user, energy_rating, focus_rating, checkin_notes))
-                    conn.commit()
-                    st.success("Self Check-In saved.")
-                    st.rerun()
-                    
-                st.divider()
-                st.subheader("Past Check-Ins")
-                checkin_hist = pd.read_sql(f"SELECT date, energy_rating, focus_rating, notes FROM therapist_checkin WHERE client_id={client_id} ORDER BY date DESC", conn)
-                st.dataframe(checkin_hist, use_container_width=True)
+                self_checkin_tab(client_id)
 
             # --- Tab 8: Resources ---
             with tab8:
-                st.subheader("📚 Client Resource List")
-                
-                col_r_title, col_r_url = st.columns(2)
-                with col_r_title:
-                    resource_title = st.text_input("Resource Title/Name", key="res_title")
-                with col_r_url:
-                    resource_url = st.text_input("Resource Link (URL)", key="res_url")
-                    
-                resource_notes = st.text_area("Description / When to use / Homework notes", height=100, key="res_notes")
-                
-                if st.button("Add Resource", type="primary", key="add_res"):
-                    if resource_title:
-                        conn.execute("INSERT INTO session_resources (client_id, title, url, notes, therapist_id) VALUES (?, ?, ?, ?, ?)",
-                                     (client_id, resource_title, resource_url, resource_notes, st.session_state.user))
-                        conn.commit()
-                        st.success(f"Resource '{resource_title}' added.")
-                        st.rerun()
-                    else:
-                        st.error("Resource Title is required.")
-                        
-                st.divider()
-                st.subheader("Assigned Resources")
-                resources_df = pd.read_sql(f"SELECT id, title, url, notes FROM session_resources WHERE client_id={client_id} ORDER BY id DESC", conn)
-                
-                for i, row in resources_df.iterrows():
-                    col_r_disp, col_r_del = st.columns([5, 1])
-                    with col_r_disp:
-                        st.markdown(f"**{row['title']}**")
-                        if row['url']:
-                            st.caption(f"Link: {row['url']}")
-                        st.markdown(f"Notes: {row['notes']}")
-                    with col_r_del:
-                        if st.button("Delete", key=f"del_res_{row['id']}"):
-                            conn.execute("DELETE FROM session_resources WHERE id=?", (row['id'],))
-                            conn.commit()
-                            st.warning(f"Resource '{row['title']}' deleted.")
-                            st.rerun()
-
-
-    # --- MY SITES ---
-    elif menu == "My Sites":
-        st.header("📍 Session Site Management")
-
-        # --- Add New Site ---
-        with st.expander("➕ Add New Session Site"):
-            site_name = st.text_input("Site Name (e.g., Downtown Office, Telehealth Link)")
-            site_address = st.text_area("Address / URL", height=50)
-            site_type = st.selectbox("Site Type", ["Office", "School", "Home Visit", "Telehealth", "Virtual"])
-            
-            if st.button("Save Site"):
-                if site_name:
-                    conn.execute("INSERT INTO sites (name, address, type, therapist_id) VALUES (?, ?, ?, ?)",
-                                 (site_name, site_address, site_type, st.session_state.user))
-                    conn.commit()
-                    st.success(f"Site '{site_name}' added.")
-                    st.rerun()
-                else:
-                    st.error("Site Name cannot be empty.")
-
-        st.divider()
-        st.subheader("🌐 Existing Sites & Caseload Breakdown")
-        
-        sites_df = pd.read_sql(f"SELECT * FROM sites WHERE therapist_id='{st.session_state.user}'", conn)
-        clients_all_df = pd.read_sql(f"SELECT id, name, site_id, status FROM clients WHERE therapist_id='{st.session_state.user}'", conn)
-
-        if sites_df.empty:
-            st.info("No sites defined yet. Add a site above.")
-        else:
-            for index, site in sites_df.iterrows():
-                site_id = site['id']
-                
-                # Filter clients for the current site
-                site_clients_df = clients_all_df[clients_all_df['site_id'] == site_id]
-                
-                with st.expander(f"**{site['name']}** ({site['type']}) - {len(site_clients_df)} Clients"):
-                    st.caption(f"Address/Details: {site['address']}")
-                    
-                    if site_clients_df.empty:
-                        st.info("No clients currently assigned to this site.")
-                    else:
-                        client_list = site_clients_df[['name', 'status']].rename(
-                            columns={'name': 'Client Name', 'status': 'Status'}
-                        )
-                        st.dataframe(client_list, use_container_width=True, hide_index=True)
+                resources_tab(client_id)
 
-                    # Option to Delete Site
-                    if st.button(f"Delete Site: {site['name']}", key=f"delete_site_{site_id}"):
-                        if len(site_clients_df) > 0:
-                             st.error("Cannot delete site: first unassign all clients.")
-                        else:
-                            conn.execute("DELETE FROM sites WHERE id=?", (site_id,))
-                            conn.commit()
-                            st.warning(f"Site '{site['name']}' deleted.")
-                            st.rerun()
 
     # --- ANALYTICS & REPORTS (Visualization and CSV Export) ---
     elif menu == "Analytics & Reports":
         st.header("📊 Analytics & Visualization")
         
-        clients = pd.read_sql(f"SELECT id, name FROM clients WHERE therapist_id='{st.session_state.user}'", conn)
+        client_names = load_clients(st.session_state.user)['name'].tolist()
         
-        if not clients.empty:
+        if client_names:
             # Filters
             col1, col2 = st.columns(2)
             with col1:
-                client_filter = st.selectbox("Filter by Participant", ["All"] + list(clients['name']))
+                client_filter = st.selectbox("Filter by Participant", ["All"] + client_names)
             with col2:
                 goal_filter = st.text_input("Search by Goal keyword (e.g., 'Anxiety')")
 
-            query = f"""
-                SELECT c.name, s.date, s.session_number, s.session_time, s.rating, s.goals_selected, s.progress_notes 
-                FROM sessions s 
-                JOIN clients c ON s.client_id = c.id 
-                WHERE s.therapist_id='{st.session_state.user}'
-            """
-            
-            df = pd.read_sql(query, conn)
+            df = load_sessions(st.session_state.user)
             
             # Apply Python Filtering
             if client_filter != "All":
                 df = df[df['name'] == client_filter]
             
             if goal_filter:
-                df = df[df['goals_selected'].str.contains(goal_filter, case=False, na=False)]
+                df = df[df['goals_selected'].str.contains(goal_filter, case=False, na=False, regex=False)]
 
             if not df.empty:
                 st.subheader("Progress Over Time")
-                # Visualization (Plotly - Rating Trend)
-                fig = px.line(df, x='date', y='rating', color='name', markers=True, title="Session Ratings (1-10)")
+                # Visualization (Plotly - Rating Trend); WebGL traces keep large caseloads responsive
+                fig = px.line(df, x='date', y='rating', color='name', markers=True, render_mode='webgl',
+                              title="Session Ratings (1-10)")
                 st.plotly_chart(fig, use_container_width=True)
                 
                 st.subheader("Goal Achievement Frequency (Sessions Addressing Goals)")
                 
-                # Visualization (Goal Frequency)
-                all_goals_addressed = []
-                for goals_str in df['goals_selected'].astype(str):
-                    all_goals_addressed.extend([g.strip() for g in goals_str.split(',') if g.strip()])
+                # Visualization (Goal Frequency) - counted in SQLite with the table's participant/keyword filters
+                goal_counts = fetch_goal_counts(st.session_state.user,
+                                                None if client_filter == "All" else client_filter, goal_filter)
                 
-                if all_goals_addressed:
-                    goal_counts = pd.Series(all_goals_addressed).value_counts().reset_index()
-                    goal_counts.columns = ['Goal', 'Sessions Addressed']
-                    
+                if not goal_counts.empty:
                     fig_goals = px.bar(goal_counts, x='Sessions Addressed', y='Goal', orientation='h', 
                                        title="Goal Frequency Across Filtered Sessions")
                     st.plotly_chart(fig_goals, use_container_width=True)
@@ -999,14 +1257,18 @@ def main_app():
                 st.dataframe(df)
                 
                 # CSV Export
-                csv = df.to_csv(index=False).encode('utf-8')
+                csv = build_csv_export(df)
                 st.download_button("Download CSV", csv, "session_data.csv", "text/csv")
                 
-                # PDF Export (Print Reports)
+                # PDF Export (Print Reports) - only built once asked for, not on every rerun
                 if client_filter != "All":
-                    soap_df = pd.read_sql(f"SELECT * FROM soap_notes WHERE client_id=(SELECT id FROM clients WHERE name='{client_filter}')", conn)
-                    pdf_bytes = create_pdf(client_filter, df, soap_df)
-                    st.download_button("Download PDF Report", pdf_bytes, f"{client_filter}_Report.pdf", "application/pdf")
+                    if st.button("Generate PDF Report"):
+                        st.session_state.pdf_report_client = client_filter
+                    if st.session_state.get("pdf_report_client") == client_filter:
+                        soap_df = query_df("SELECT * FROM soap_notes WHERE client_id=(SELECT id FROM clients WHERE name=? AND therapist_id=?)",
+                                           params=[client_filter, st.session_state.user])
+                        pdf_bytes = build_pdf_report(client_filter, df, soap_df)
+                        st.download_button("Download PDF Report", pdf_bytes, f"{client_filter}_Report.pdf", "application/pdf")
             else:
                 st.info("No data matches these filters.")
 
@@ -1014,7 +1276,7 @@ def main_app():
     elif menu == "Goal Management":
         st.header("🎯 Goal Templates")
         
-        goals_df = pd.read_sql("SELECT * FROM goals", conn)
+        goals_df = load_all_goals()
         st.dataframe(goals_df, use_container_width=True)
         
         st.subheader("Add New Goal Template")
@@ -1030,8 +1292,9 @@ def main_app():
             new_desc = st.text_input("Goal Description")
             
         if st.button("Add Goal"):
-            conn.execute("INSERT INTO goals (category, description) VALUES (?, ?)", (new_cat, new_desc))
-            conn.commit()
+            with pool.write() as conn:
+                conn.execute("INSERT INTO goals (category, description) VALUES (?, ?)", (new_cat, new_desc))
+            load_all_goals.clear()
             st.success("Goal added to dropdown menu.")
             st.rerun()
             
@@ -1040,13 +1303,12 @@ def main_app():
         if not goals_df.empty:
             goal_to_delete = st.selectbox("Select Goal to Delete", goals_df['description'], key="delete_goal_select")
             if st.button("Delete Selected Goal"):
-                conn.execute("DELETE FROM goals WHERE description=?", (goal_to_delete,))
-                conn.commit()
+                with pool.write() as conn:
+                    conn.execute("DELETE FROM goals WHERE description=?", (goal_to_delete,))
+                load_all_goals.clear()
                 st.warning(f"Goal '{goal_to_delete}' deleted.")
                 st.rerun()
 
-    conn.close()
-
 # --- RUN ---
 if st.session_state.logged_in:
     main_app()